@@ -0,0 +1,86 @@
+# assets.py
+import io
+import os
+import threading
+import zlib
+
+import pygame
+
+PIECES = [f'{color}{piece}' for color in ['w', 'b'] for piece in ['p', 'R', 'N', 'B', 'Q', 'K']]
+SOUND_FILES = {
+    'move': 'move.wav',
+    'capture': 'capture.wav',
+    'castle': 'castle.wav',
+    'check': 'check.wav',
+    'invalid': 'invalid.wav',
+    'promote': 'promote.wav'
+}
+
+# Decodes the piece images and reads the sound files on a background thread
+# so the menu can be shown straight away. The thread never touches the display
+# or the mixer: images are converted when the sprite atlas scales them, and
+# the mixer is only opened when sounds() is first called from the main loop.
+class AssetLoader:
+    def __init__(self, image_dir='images', sound_dir='sounds'):
+        self.image_dir = image_dir
+        self.sound_dir = sound_dir
+        self.decoded = {}
+        self.sound_data = {}
+        self.loaded_sounds = None
+        self.thread = threading.Thread(target=self.load, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def load(self):
+        for name in PIECES:
+            try:
+                self.decoded[name] = pygame.image.load(os.path.join(self.image_dir, f'{name}.png'))
+            except (pygame.error, OSError):
+                self.decoded[name] = None
+        for name, filename in SOUND_FILES.items():
+            try:
+                with open(os.path.join(self.sound_dir, filename), 'rb') as f:
+                    self.sound_data[name] = f.read()
+            except OSError:
+                self.sound_data[name] = None
+
+    # Decoded piece images by name, None where the file could not be loaded.
+    # Blocks until the loader thread is done.
+    def images(self):
+        self.thread.join()
+        return self.decoded
+
+    # Identifies the current image files, so cached sprites made from older
+    # ones are not reused.
+    def stamp(self):
+        parts = []
+        for name in PIECES:
+            try:
+                st = os.stat(os.path.join(self.image_dir, f'{name}.png'))
+            except OSError:
+                continue
+            parts.append(f'{name}:{st.st_size}:{st.st_mtime_ns}')
+        return f'{zlib.crc32(" ".join(parts).encode()):08x}'
+
+    def sounds(self):
+        if self.loaded_sounds is not None:
+            return self.loaded_sounds
+        self.thread.join()
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            pass
+        self.loaded_sounds = {}
+        for name, filename in SOUND_FILES.items():
+            sound = None
+            if self.sound_data[name] is not None:
+                try:
+                    sound = pygame.mixer.Sound(file=io.BytesIO(self.sound_data[name]))
+                    sound.set_volume(0.6)
+                except pygame.error:
+                    sound = None
+            if sound is None:
+                print(f"⚠️ Warning: '{filename}' not found. Sound disabled.")
+            self.loaded_sounds[name] = sound
+        return self.loaded_sounds
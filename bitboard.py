@@ -0,0 +1,127 @@
+import random
+
+# Square index is row * 8 + col, matching ChessGame.board[row][col] (row 0 is rank 8).
+
+PIECES = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+FULL = (1 << 64) - 1
+
+def square(row, col):
+    return row * 8 + col
+
+def bit(row, col):
+    return 1 << (row * 8 + col)
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+def iter_squares(bb):
+    while bb:
+        b = bb & -bb
+        yield b.bit_length() - 1
+        bb ^= b
+
+def _on_board(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+def _leaper_table(deltas):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mask = 0
+        for dr, dc in deltas:
+            if _on_board(r + dr, c + dc):
+                mask |= bit(r + dr, c + dc)
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _leaper_table([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+# White pawns move towards row 0, black pawns towards row 7.
+PAWN_ATTACKS = {
+    'w': _leaper_table([(-1, -1), (-1, 1)]),
+    'b': _leaper_table([(1, -1), (1, 1)]),
+}
+
+# Rays are split by whether the square index grows along them, so the nearest
+# blocker is the lowest set bit for increasing rays and the highest for decreasing ones.
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mask = 0
+        r, c = r + dr, c + dc
+        while _on_board(r, c):
+            mask |= bit(r, c)
+            r, c = r + dr, c + dc
+        table.append(mask)
+    return table
+
+def _increasing(dr, dc):
+    return dr * 8 + dc > 0
+
+RAYS = {d: _ray_table(*d) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+_ROOK_RAYS = [(RAYS[d], _increasing(*d)) for d in ROOK_DIRECTIONS]
+_BISHOP_RAYS = [(RAYS[d], _increasing(*d)) for d in BISHOP_DIRECTIONS]
+
+def _slide(rays, sq, occ):
+    attacks = 0
+    for table, increasing in rays:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            first = (blockers & -blockers).bit_length() - 1 if increasing else blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occ):
+    return _slide(_ROOK_RAYS, sq, occ)
+
+def bishop_attacks(sq, occ):
+    return _slide(_BISHOP_RAYS, sq, occ)
+
+def queen_attacks(sq, occ):
+    return _slide(_ROOK_RAYS, sq, occ) | _slide(_BISHOP_RAYS, sq, occ)
+
+def _between_table():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for d, table in RAYS.items():
+            opposite = RAYS[(-d[0], -d[1])]
+            for target in iter_squares(table[sq]):
+                between[sq][target] = table[sq] & ~table[target] & ~(1 << target)
+                line[sq][target] = table[sq] | opposite[sq] | (1 << sq)
+    return between, line
+
+# BETWEEN[a][b] holds the squares strictly between two aligned squares and
+# LINE[a][b] the whole rank, file or diagonal through them; both are 0 otherwise.
+BETWEEN, LINE = _between_table()
+
+def _zobrist_tables():
+    # Fixed seed so keys agree between processes and across restarts.
+    rng = random.Random(0x5EED)
+    pieces = {piece: [rng.getrandbits(64) for _ in range(64)] for piece in PIECES}
+    castling = [rng.getrandbits(64) for _ in range(16)]
+    en_passant = [rng.getrandbits(64) for _ in range(8)]
+    return pieces, castling, en_passant, rng.getrandbits(64)
+
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT, ZOBRIST_BLACK_TO_MOVE = _zobrist_tables()
+
+def square_name(sq):
+    row, col = divmod(sq, 8)
+    return 'abcdefgh'[col] + str(8 - row)
+
+def parse_square(name):
+    return square(8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+def move_to_uci(move):
+    frm, to, promotion = move
+    return square_name(frm) + square_name(to) + (promotion.lower() if promotion else '')
+
+def uci_to_move(text):
+    promotion = text[4].upper() if len(text) > 4 else None
+    return (parse_square(text[:2]), parse_square(text[2:4]), promotion)
@@ -0,0 +1,748 @@
+import time
+from collections import Counter, namedtuple
+from bitboard import (
+    PIECES, FULL, square, bit, lsb, iter_squares, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS,
+    rook_attacks, bishop_attacks, queen_attacks, BETWEEN, LINE,
+    ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT, ZOBRIST_BLACK_TO_MOVE,
+    parse_square, move_to_uci
+)
+
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+
+# (base seconds, increment seconds, category, label); shared by the menu and the server.
+TIME_CONTROLS = [
+    (60, 0, "Bullet", "1+0"),
+    (120, 1, "Bullet", "2+1"),
+    (180, 0, "Blitz", "3+0"),
+    (180, 2, "Blitz", "3+2"),
+    (300, 0, "Blitz", "5+0"),
+    (300, 3, "Blitz", "5+3"),
+    (600, 0, "Rapid", "10+0"),
+    (600, 5, "Rapid", "10+5"),
+    (900, 10, "Rapid", "15+10"),
+    (1800, 0, "Classical", "30+0"),
+    (1800, 20, "Classical", "30+20"),
+    ("Custom", 0, "Custom", "Custom")
+]
+
+def monotonic_ms():
+    return int(time.monotonic() * 1000)
+
+def get_piece_value(piece):
+    if not piece:
+        return 0
+    ptype = piece[1]
+    values = {'p': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 0}
+    return values.get(ptype, 0)
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+
+# Castling rights that survive a move touching each square (king and rook home squares).
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[square(7, 4)] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square(7, 7)] &= ~WHITE_KINGSIDE
+CASTLING_MASK[square(7, 0)] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[square(0, 4)] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square(0, 7)] &= ~BLACK_KINGSIDE
+CASTLING_MASK[square(0, 0)] &= ~BLACK_QUEENSIDE
+
+# result is None while play continues, otherwise 'checkmate', 'stalemate',
+# 'insufficient', 'threefold' or 'fifty-move'.
+Status = namedtuple('Status', ['in_check', 'result'])
+
+class GameState:
+    # Undo record for push/pop: only what a move destroys.
+    __slots__ = ('move', 'captured', 'castling_rights', 'en_passant_target', 'halfmove_clock')
+
+    def __init__(self, move, captured, castling_rights, en_passant_target, halfmove_clock):
+        self.move = move
+        self.captured = captured
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.halfmove_clock = halfmove_clock
+
+class ChessGame:
+    # clock returns milliseconds from any fixed origin and defaults to a
+    # monotonic clock, which both the GUI and the server use.
+    def __init__(self, base_time=60, increment=0, clock=None):
+        self.clock = clock or monotonic_ms
+        self.board = self.create_board()
+        self.current_player = 'w'
+        self.king_positions = {'w': (7, 4), 'b': (0, 4)}
+        self.castling_rights = ALL_CASTLING
+        self.en_passant_target = None
+        self.selected = None
+        self.valid_moves = []
+        self.history = []
+        self.ui_history = []
+        self.promotion_pending = None
+        self.pending_promotion = None
+        self._status = None
+        self._legal_moves = None
+        self.position_history = []
+        self.position_counts = Counter()
+        self.halfmove_clock = 0
+        self.last_move = None
+        self.game_over = False
+        self.winner = None
+        self.draw_offered = False
+        self.resigned = False
+        self.base_time = base_time
+        self.increment = increment
+        self.white_time = float(base_time)
+        self.black_time = float(base_time)
+        self.first_move_made = False
+        self.white_made_first = False
+        self.black_made_first = False
+        self.white_captured_value = 0
+        self.black_captured_value = 0
+        self.last_tick = None
+        self.flipped = False  # ← Needed for coordinate drawing
+        self.sync_bitboards()
+        self.reset_history()
+
+    def create_board(self):
+        return [
+            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
+            ['bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp'],
+            [None]*8,
+            [None]*8,
+            [None]*8,
+            [None]*8,
+            ['wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp'],
+            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR']
+        ]
+
+    # ... [rest of ChessGame methods unchanged: get_position_key, is_path_clear, is_valid_move, etc.] ...
+    # (All methods below are identical to your working version — only `flip` and drawing will use `flipped`)
+
+    def get_position_key(self):
+        return self.zobrist_key
+
+    # Side to move, castling rights and a capturable en-passant file; the
+    # piece part of the key is kept up to date by set_square.
+    def state_key(self):
+        key = ZOBRIST_CASTLING[self.castling_rights]
+        if self.current_player == 'b':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_target:
+            row, col = self.en_passant_target
+            enemy = 'b' if self.current_player == 'w' else 'w'
+            if PAWN_ATTACKS[enemy][square(row, col)] & self.bitboards[self.current_player + 'p']:
+                key ^= ZOBRIST_EN_PASSANT[col]
+        return key
+
+    def compute_zobrist_key(self):
+        key = self.state_key()
+        for piece, bb in self.bitboards.items():
+            for sq in iter_squares(bb):
+                key ^= ZOBRIST_PIECES[piece][sq]
+        return key
+
+    def add_current_position_to_history(self):
+        self.position_history.append(self.zobrist_key)
+        self.position_counts[self.zobrist_key] += 1
+
+    def sync_bitboards(self):
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece:
+                    self.bitboards[piece] |= bit(r, c)
+                    self.occupancy[piece[0]] |= bit(r, c)
+
+    def set_square(self, row, col, piece):
+        b = bit(row, col)
+        old = self.board[row][col]
+        if old:
+            self.bitboards[old] ^= b
+            self.occupancy[old[0]] ^= b
+            self.zobrist_key ^= ZOBRIST_PIECES[old][row * 8 + col]
+        if piece:
+            self.bitboards[piece] |= b
+            self.occupancy[piece[0]] |= b
+            self.zobrist_key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        self.board[row][col] = piece
+
+    def load_board(self, board):
+        self.board = [row[:] for row in board]
+        self.sync_bitboards()
+        self.king_positions = {'w': None, 'b': None}
+        for color in ('w', 'b'):
+            king = self.bitboards[color + 'K']
+            if king:
+                self.king_positions[color] = divmod(lsb(king), 8)
+        self.castling_rights = ALL_CASTLING
+        self.en_passant_target = None
+        self.reset_history()
+
+    def load_fen(self, fen):
+        fields = fen.split()
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row.extend([None] * int(ch))
+                else:
+                    color = 'w' if ch.isupper() else 'b'
+                    ptype = 'p' if ch in 'pP' else ch.upper()
+                    row.append(color + ptype)
+            board.append(row)
+        self.load_board(board)
+        self.current_player = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        self.castling_rights = sum(
+            right for flag, right in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE),
+                                      ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE))
+            if flag in castling
+        )
+        if len(fields) > 3 and fields[3] != '-':
+            self.en_passant_target = divmod(parse_square(fields[3]), 8)
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.promotion_pending = None
+        self.pending_promotion = None
+        self.reset_history()
+
+    def edit_square(self, row, col, piece):
+        self.set_square(row, col, piece)
+        if piece and piece[1] == 'K':
+            self.king_positions[piece[0]] = (row, col)
+        self.reset_history()
+
+    # Editor changes are not moves, so the undo stack cannot span them.
+    def reset_history(self):
+        self._status = None
+        self._legal_moves = None
+        self.zobrist_key = self.compute_zobrist_key()
+        self.history = []
+        self.ui_history = []
+        self.position_history = []
+        self.position_counts = Counter()
+        self.last_move = None
+        self.add_current_position_to_history()
+
+    def attackers_to(self, sq, color, occ=None):
+        bb = self.bitboards
+        if occ is None:
+            occ = self.occupancy['w'] | self.occupancy['b']
+        enemy = 'b' if color == 'w' else 'w'
+        attackers = PAWN_ATTACKS[enemy][sq] & bb[color + 'p']
+        attackers |= KNIGHT_ATTACKS[sq] & bb[color + 'N']
+        attackers |= KING_ATTACKS[sq] & bb[color + 'K']
+        diagonal = bb[color + 'B'] | bb[color + 'Q']
+        if diagonal:
+            attackers |= bishop_attacks(sq, occ) & diagonal
+        straight = bb[color + 'R'] | bb[color + 'Q']
+        if straight:
+            attackers |= rook_attacks(sq, occ) & straight
+        return attackers
+
+    def piece_attacks(self, sq, piece, occ):
+        ptype = piece[1]
+        if ptype == 'p':
+            return PAWN_ATTACKS[piece[0]][sq]
+        if ptype == 'N':
+            return KNIGHT_ATTACKS[sq]
+        if ptype == 'B':
+            return bishop_attacks(sq, occ)
+        if ptype == 'R':
+            return rook_attacks(sq, occ)
+        if ptype == 'Q':
+            return queen_attacks(sq, occ)
+        if ptype == 'K':
+            return KING_ATTACKS[sq]
+        return 0
+
+    def is_path_clear(self, start, end):
+        occ = self.occupancy['w'] | self.occupancy['b']
+        return not BETWEEN[square(*start)][square(*end)] & occ
+
+    def is_valid_move(self, start, end):
+        if self.promotion_pending:
+            return False
+        sr, sc = start
+        er, ec = end
+        piece = self.board[sr][sc]
+        if piece is None or piece[0] != self.current_player:
+            return False
+        target = self.board[er][ec]
+        if target and target[0] == self.current_player:
+            return False
+        ptype = piece[1]
+        col_diff = ec - sc
+        if ptype == 'p':
+            direction = -1 if self.current_player == 'w' else 1
+            start_row = 6 if self.current_player == 'w' else 1
+            if sc == ec:
+                if er == sr + direction and target is None:
+                    return True
+                if sr == start_row and er == sr + 2*direction and target is None and self.board[sr + direction][sc] is None:
+                    return True
+            elif abs(col_diff) == 1 and er == sr + direction and target:
+                return True
+            elif abs(col_diff) == 1 and er == sr + direction and target is None and self.en_passant_target == (er, ec):
+                return True
+            return False
+        if ptype == 'K' and abs(col_diff) == 2 and sr == er:
+            if self.current_player == 'w':
+                right = WHITE_QUEENSIDE if col_diff < 0 else WHITE_KINGSIDE
+            else:
+                right = BLACK_QUEENSIDE if col_diff < 0 else BLACK_KINGSIDE
+            if not self.castling_rights & right:
+                return False
+            path = range(sc-1, sc-4, -1) if col_diff < 0 else range(sc+1, sc+3)
+            path_mask = 0
+            for c in path:
+                if not 0 <= c < 8:
+                    return False
+                path_mask |= bit(sr, c)
+            if path_mask & (self.occupancy['w'] | self.occupancy['b']):
+                return False
+            middle_sq = square(sr, sc - 1 if col_diff < 0 else sc + 1)
+            enemy = 'b' if self.current_player == 'w' else 'w'
+            return not self.attackers_to(middle_sq, enemy)
+        occ = self.occupancy['w'] | self.occupancy['b']
+        return bool(self.piece_attacks(square(sr, sc), piece, occ) & bit(er, ec))
+
+    def is_in_check(self, player):
+        king = self.bitboards[player + 'K']
+        if not king:
+            return False
+        enemy = 'b' if player == 'w' else 'w'
+        return bool(self.attackers_to(lsb(king), enemy))
+
+    def is_valid_attack(self, start, end):
+        sr, sc = start
+        piece = self.board[sr][sc]
+        if not piece:
+            return False
+        occ = self.occupancy['w'] | self.occupancy['b']
+        return bool(self.piece_attacks(square(sr, sc), piece, occ) & bit(*end))
+
+    # Moves are (from_sq, to_sq, promotion) with squares as in bitboard.square()
+    # and promotion one of PROMOTION_PIECES or None.
+    def generate_legal_moves(self):
+        if self.promotion_pending:
+            return []
+        color = self.current_player
+        enemy = 'b' if color == 'w' else 'w'
+        bb = self.bitboards
+        own = self.occupancy[color]
+        them = self.occupancy[enemy]
+        occ = own | them
+        moves = []
+        append = moves.append
+
+        king = bb[color + 'K']
+        check_mask = FULL
+        pinned = 0
+        pin_rays = {}
+        checkers = 0
+        if king:
+            king_sq = lsb(king)
+            checkers = self.attackers_to(king_sq, enemy, occ)
+            without_king = occ ^ king
+            for to in iter_squares(KING_ATTACKS[king_sq] & ~own):
+                if not self.attackers_to(to, enemy, without_king):
+                    append((king_sq, to, None))
+            if checkers & (checkers - 1):
+                return moves
+            if checkers:
+                check_mask = checkers | BETWEEN[king_sq][lsb(checkers)]
+            snipers = rook_attacks(king_sq, them) & (bb[enemy + 'R'] | bb[enemy + 'Q'])
+            snipers |= bishop_attacks(king_sq, them) & (bb[enemy + 'B'] | bb[enemy + 'Q'])
+            for sniper in iter_squares(snipers):
+                blockers = BETWEEN[king_sq][sniper] & occ
+                if blockers and not blockers & (blockers - 1) and blockers & own:
+                    pinned |= blockers
+                    pin_rays[lsb(blockers)] = LINE[king_sq][sniper]
+
+        targets = ~own & check_mask
+        for ptype in ('N', 'B', 'R', 'Q'):
+            piece = color + ptype
+            for sq in iter_squares(bb[piece]):
+                allowed = targets
+                if pinned >> sq & 1:
+                    allowed &= pin_rays[sq]
+                for to in iter_squares(self.piece_attacks(sq, piece, occ) & allowed):
+                    append((sq, to, None))
+
+        if color == 'w':
+            step, start_row, last_row = -8, 6, 0
+        else:
+            step, start_row, last_row = 8, 1, 7
+        pawn_attacks = PAWN_ATTACKS[color]
+        for sq in iter_squares(bb[color + 'p']):
+            allowed = check_mask
+            if pinned >> sq & 1:
+                allowed &= pin_rays[sq]
+            reach = pawn_attacks[sq] & them
+            one = sq + step
+            if 0 <= one < 64 and not occ >> one & 1:
+                reach |= 1 << one
+                two = one + step
+                if sq >> 3 == start_row and not occ >> two & 1:
+                    reach |= 1 << two
+            for to in iter_squares(reach & allowed):
+                if to >> 3 == last_row:
+                    for promotion in PROMOTION_PIECES:
+                        append((sq, to, promotion))
+                else:
+                    append((sq, to, None))
+
+        if self.en_passant_target:
+            ep_sq = square(*self.en_passant_target)
+            captured = 1 << (ep_sq - step)
+            for sq in iter_squares(PAWN_ATTACKS[enemy][ep_sq] & bb[color + 'p']):
+                after = occ ^ (1 << sq) ^ captured | (1 << ep_sq)
+                if not king or not self.attackers_to(king_sq, enemy, after) & ~captured:
+                    append((sq, ep_sq, None))
+
+        rights = self.castling_rights
+        if color == 'b':
+            rights >>= 2
+        if king and not checkers and rights & 3:
+            home = 56 if color == 'w' else 0
+            if king_sq == home + 4:
+                rooks = bb[color + 'R']
+                if (rights & WHITE_KINGSIDE and rooks >> (home + 7) & 1
+                        and not occ & (3 << (home + 5))
+                        and not self.attackers_to(home + 5, enemy, occ)
+                        and not self.attackers_to(home + 6, enemy, occ)):
+                    append((king_sq, home + 6, None))
+                if (rights & WHITE_QUEENSIDE and rooks >> home & 1
+                        and not occ & (7 << (home + 1))
+                        and not self.attackers_to(home + 3, enemy, occ)
+                        and not self.attackers_to(home + 2, enemy, occ)):
+                    append((king_sq, home + 2, None))
+        return moves
+
+    def has_legal_moves(self, player):
+        return player == self.current_player and bool(self.legal_moves)
+
+    def is_checkmate(self, player):
+        return self.is_in_check(player) and not self.has_legal_moves(player)
+
+    def is_stalemate(self, player):
+        return not self.is_in_check(player) and not self.has_legal_moves(player)
+
+    def is_insufficient_material(self):
+        white_pieces = []
+        black_pieces = []
+        for row in self.board:
+            for piece in row:
+                if piece:
+                    if piece[0] == 'w':
+                        white_pieces.append(piece[1])
+                    else:
+                        black_pieces.append(piece[1])
+
+        def is_minor_only(pieces):
+            filtered = [p for p in pieces if p != 'K']
+            if not filtered:
+                return True
+            for p in filtered:
+                if p not in ('B', 'N'):
+                    return False
+            return True
+
+        if not is_minor_only(white_pieces) or not is_minor_only(black_pieces):
+            return False
+
+        white_minors = [p for p in white_pieces if p != 'K']
+        black_minors = [p for p in black_pieces if p != 'K']
+
+        if not white_minors and not black_minors:
+            return True
+        if (len(white_minors) == 1 and not black_minors) or (not white_minors and len(black_minors) == 1):
+            return True
+        if len(white_minors) == 1 and len(black_minors) == 1:
+            if white_minors[0] == 'B' and black_minors[0] == 'B':
+                white_bishop_sq = None
+                black_bishop_sq = None
+                for r in range(8):
+                    for c in range(8):
+                        piece = self.board[r][c]
+                        if piece == 'wB':
+                            white_bishop_sq = (r, c)
+                        elif piece == 'bB':
+                            black_bishop_sq = (r, c)
+                if white_bishop_sq and black_bishop_sq:
+                    w_color = (white_bishop_sq[0] + white_bishop_sq[1]) % 2
+                    b_color = (black_bishop_sq[0] + black_bishop_sq[1]) % 2
+                    if w_color == b_color:
+                        return True
+        all_pieces = white_pieces + black_pieces
+        for p in all_pieces:
+            if p in ('p', 'R', 'Q'):
+                return False
+        return True
+
+    def is_threefold_repetition(self):
+        return self.position_counts[self.zobrist_key] >= 3
+
+    # Nothing before the last capture or pawn move can recur, so search only
+    # needs to look back halfmove_clock plies, at positions with the same side to move.
+    def is_repetition(self):
+        key = self.zobrist_key
+        history = self.position_history
+        stop = max(len(history) - 2 - self.halfmove_clock, -1)
+        for i in range(len(history) - 3, stop, -2):
+            if history[i] == key:
+                return True
+        return False
+
+    def is_fifty_move_rule(self):
+        return self.halfmove_clock >= 100
+
+    # Computed once per position together with status; treat the list as read-only.
+    @property
+    def legal_moves(self):
+        if self._legal_moves is None:
+            self._legal_moves = self.generate_legal_moves()
+        return self._legal_moves
+
+    # Computed once per position; push, pop, promotion and editor changes reset it.
+    @property
+    def status(self):
+        if self._status is None:
+            player = self.current_player
+            if self.promotion_pending:
+                self._status = Status(False, None)
+                return self._status
+            in_check = self.is_in_check(player)
+            result = None
+            if not self.legal_moves:
+                result = 'checkmate' if in_check else 'stalemate'
+            elif self.is_insufficient_material():
+                result = 'insufficient'
+            elif self.is_threefold_repetition():
+                result = 'threefold'
+            elif self.is_fifty_move_rule():
+                result = 'fifty-move'
+            self._status = Status(in_check, result)
+        return self._status
+
+    def push(self, move):
+        frm, to, promotion = move
+        board = self.board
+        fr, fc = divmod(frm, 8)
+        tr, tc = divmod(to, 8)
+        piece = board[fr][fc]
+        color = piece[0]
+        ptype = piece[1]
+        captured = board[tr][tc]
+        en_passant_target = self.en_passant_target
+        self.history.append(GameState(move, captured, self.castling_rights, en_passant_target, self.halfmove_clock))
+        self.zobrist_key ^= self.state_key()
+        self.set_square(fr, fc, None)
+        if ptype == 'p' and fc != tc and captured is None:
+            captured = board[fr][tc]
+            self.history[-1].captured = captured
+            self.set_square(fr, tc, None)
+        self.set_square(tr, tc, color + promotion if promotion else piece)
+        if ptype == 'K':
+            self.king_positions[color] = (tr, tc)
+            if abs(tc - fc) == 2:
+                rook_from, rook_to = (0, 3) if tc < fc else (7, 5)
+                self.set_square(fr, rook_to, board[fr][rook_from])
+                self.set_square(fr, rook_from, None)
+        self.castling_rights &= CASTLING_MASK[frm] & CASTLING_MASK[to]
+        if ptype == 'p' and abs(tr - fr) == 2:
+            self.en_passant_target = ((fr + tr) // 2, fc)
+        else:
+            self.en_passant_target = None
+        if ptype == 'p' or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.current_player = 'b' if color == 'w' else 'w'
+        self.zobrist_key ^= self.state_key()
+        self.add_current_position_to_history()
+        self._status = None
+        self._legal_moves = None
+
+    def pop(self):
+        state = self.history.pop()
+        self._status = None
+        self._legal_moves = None
+        self.zobrist_key ^= self.state_key()
+        frm, to, promotion = state.move
+        board = self.board
+        fr, fc = divmod(frm, 8)
+        tr, tc = divmod(to, 8)
+        piece = board[tr][tc]
+        color = piece[0]
+        if promotion:
+            piece = color + 'p'
+        self.set_square(fr, fc, piece)
+        if piece[1] == 'p' and fc != tc and state.en_passant_target == (tr, tc):
+            self.set_square(tr, tc, None)
+            self.set_square(fr, tc, state.captured)
+        else:
+            self.set_square(tr, tc, state.captured)
+        if piece[1] == 'K':
+            self.king_positions[color] = (fr, fc)
+            if abs(tc - fc) == 2:
+                rook_from, rook_to = (0, 3) if tc < fc else (7, 5)
+                self.set_square(fr, rook_from, board[fr][rook_to])
+                self.set_square(fr, rook_to, None)
+        self.castling_rights = state.castling_rights
+        self.en_passant_target = state.en_passant_target
+        self.halfmove_clock = state.halfmove_clock
+        self.current_player = color
+        self.zobrist_key ^= self.state_key()
+        self.position_counts[self.position_history.pop()] -= 1
+        return state
+
+    def make_move(self, start, end, sounds=None):
+        if self.promotion_pending:
+            return
+        piece = self.board[start[0]][start[1]]
+        if piece[1] == 'p' and end[0] in (0, 7):
+            # Show the pawn on the last rank until promote_pawn supplies the piece.
+            self.promotion_pending = (end[0], end[1], piece[0])
+            self.pending_promotion = (start, end, self.board[end[0]][end[1]])
+            self._status = None
+            self._legal_moves = None
+            self.set_square(end[0], end[1], piece)
+            self.set_square(start[0], start[1], None)
+            self.last_move = (start, end)
+            return
+        self.play_move((square(*start), square(*end), None), sounds)
+
+    def promote_pawn(self, choice, sounds=None):
+        if not self.promotion_pending:
+            return
+        start, end, captured = self.pending_promotion
+        row, col, color = self.promotion_pending
+        self.set_square(start[0], start[1], color + 'p')
+        self.set_square(row, col, captured)
+        self.promotion_pending = None
+        self.pending_promotion = None
+        self._status = None
+        self._legal_moves = None
+        self.play_move((square(*start), square(*end), choice), sounds)
+
+    def play_move(self, move, sounds=None):
+        frm, to, promotion = move
+        start, end = divmod(frm, 8), divmod(to, 8)
+        piece = self.board[start[0]][start[1]]
+        player = piece[0]
+        if promotion:
+            sound_type = 'promote'
+        elif piece[1] == 'K' and abs(start[1] - end[1]) == 2:
+            sound_type = 'castle'
+        elif self.board[end[0]][end[1]] or (piece[1] == 'p' and start[1] != end[1]):
+            sound_type = 'capture'
+        else:
+            sound_type = 'move'
+        self.ui_history.append((sound_type, self.white_time, self.black_time, self.white_made_first, self.black_made_first))
+        self.push(move)
+        captured_value = get_piece_value(self.history[-1].captured)
+        if player == 'w':
+            self.white_captured_value += captured_value
+        else:
+            self.black_captured_value += captured_value
+        self.last_move = (start, end)
+        if player == 'w' and not self.white_made_first:
+            self.white_made_first = True
+        elif player == 'b' and not self.black_made_first:
+            self.black_made_first = True
+        if self.white_made_first and self.black_made_first:
+            if player == 'w':
+                self.white_time += self.increment
+            else:
+                self.black_time += self.increment
+        if sounds and sounds.get(sound_type):
+            sounds[sound_type].play()
+        self.selected = None
+        self.valid_moves = []
+        if self.white_made_first and self.black_made_first and self.last_tick is None:
+            self.last_tick = self.clock()
+
+    def undo_move(self, sounds=None):
+        if self.promotion_pending:
+            start, end, captured = self.pending_promotion
+            row, col, color = self.promotion_pending
+            self.set_square(start[0], start[1], color + 'p')
+            self.set_square(row, col, captured)
+            self.promotion_pending = None
+            self.pending_promotion = None
+        elif self.history:
+            state = self.pop()
+            sound_type, self.white_time, self.black_time, self.white_made_first, self.black_made_first = self.ui_history.pop()
+            captured_value = get_piece_value(state.captured)
+            if self.current_player == 'w':
+                self.white_captured_value -= captured_value
+            else:
+                self.black_captured_value -= captured_value
+            if sounds and sounds.get(sound_type):
+                sounds[sound_type].play()
+        else:
+            return
+        self.last_move = None
+        if self.history:
+            frm, to, promotion = self.history[-1].move
+            self.last_move = (divmod(frm, 8), divmod(to, 8))
+        self.selected = None
+        self.valid_moves = []
+        self.last_tick = self.clock() if (self.white_made_first and self.black_made_first) else None
+        self.game_over = False
+        self.winner = None
+        self.draw_offered = False
+        self.resigned = False
+
+    def perft(self, depth):
+        if depth == 0:
+            return 1
+        moves = self.generate_legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.push(move)
+            nodes += self.perft(depth - 1)
+            self.pop()
+        return nodes
+
+    def divide(self, depth):
+        counts = {}
+        for move in self.generate_legal_moves():
+            self.push(move)
+            counts[move_to_uci(move)] = self.perft(depth - 1)
+            self.pop()
+        return counts
+
+    # lag is milliseconds of the elapsed time not charged to the player to
+    # move, e.g. the server's estimate of network delay.
+    def update_clock(self, lag=0):
+        if self.game_over or self.promotion_pending or self.last_tick is None:
+            return
+        if not (self.white_made_first and self.black_made_first):
+            return
+        now = self.clock()
+        elapsed = max(0, now - self.last_tick - lag) / 1000.0
+        if self.current_player == 'w':
+            self.white_time -= elapsed
+            if self.white_time <= 0:
+                self.game_over = True
+                self.winner = 'b'
+        else:
+            self.black_time -= elapsed
+            if self.black_time <= 0:
+                self.game_over = True
+                self.winner = 'w'
+        self.last_tick = now
+
+    def get_valid_moves(self, start):
+        sq = square(*start)
+        return [
+            divmod(to, 8)
+            for frm, to, promotion in self.legal_moves
+            if frm == sq and promotion in (None, 'Q')
+        ]
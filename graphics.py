@@ -0,0 +1,118 @@
+# graphics.py
+import os
+from collections import OrderedDict
+
+import pygame
+
+from assets import PIECES
+
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+PLACEHOLDER_COLORS = {'w': (255, 255, 255), 'b': (0, 0, 0)}
+
+# Rendered text surfaces keyed by (font, text, color). Labels and clock
+# strings repeat from frame to frame, so most frames render no text at all;
+# the oldest entries are dropped once there are more than `capacity`.
+class TextCache:
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+# Piece sprites scaled to a square size. The decoded images come from an
+# AssetLoader and are kept, so a new size is a scale and convert of what is
+# already in memory rather than a reload from disk; the last `capacity` sizes
+# stay cached so dragging a window edge back and forth does not rescale every
+# frame. With a cache_dir, scaled sprites are also saved there as raw RGBA and
+# later runs load them without decoding or scaling the PNGs at all. A piece
+# whose image could not be loaded is drawn as a plain disc.
+class SpriteAtlas:
+    def __init__(self, loader, cache_dir=None, capacity=3):
+        self.loader = loader
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.sizes = OrderedDict()
+        self.stamp = loader.stamp() if cache_dir else None
+
+    def get(self, square_size):
+        sprites = self.sizes.get(square_size)
+        if sprites is None:
+            sprites = self.sizes[square_size] = {name: self.sprite(name, square_size) for name in PIECES}
+            if len(self.sizes) > self.capacity:
+                self.sizes.popitem(last=False)
+        else:
+            self.sizes.move_to_end(square_size)
+        return sprites
+
+    def sprite(self, name, square_size):
+        path = None
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f'{name}-{square_size}-{self.stamp}.rgba')
+            try:
+                with open(path, 'rb') as f:
+                    return pygame.image.frombytes(f.read(), (square_size, square_size), 'RGBA').convert_alpha()
+            except (OSError, ValueError):
+                pass
+        image = self.loader.images()[name]
+        if image is None:
+            surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+            pygame.draw.circle(surface, PLACEHOLDER_COLORS[name[0]], (square_size//2, square_size//2), square_size//3)
+            return surface.convert_alpha()
+        surface = pygame.transform.scale(image, (square_size, square_size)).convert_alpha()
+        if path:
+            save_sprite(surface, path)
+        return surface
+
+def save_sprite(surface, path):
+    tmp = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(pygame.image.tobytes(surface, 'RGBA'))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+# The empty board with its file and rank labels, drawn once per orientation
+# and then blitted whole. Only the current square size is kept.
+class BoardLayer:
+    def __init__(self):
+        self.surfaces = {}
+        self.square_size = None
+
+    def get(self, flipped, square_size, coord_font):
+        if square_size != self.square_size:
+            self.surfaces.clear()
+            self.square_size = square_size
+        surface = self.surfaces.get(flipped)
+        if surface is None:
+            surface = self.surfaces[flipped] = draw_board(flipped, square_size, coord_font)
+        return surface
+
+def draw_board(flipped, square_size, coord_font):
+    surface = pygame.Surface((square_size * 8, square_size * 8))
+    for row in range(8):
+        for col in range(8):
+            color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
+            x = col * square_size
+            y = row * square_size
+            pygame.draw.rect(surface, color, (x, y, square_size, square_size))
+            if row == 7:
+                file_text = chr(ord('h') - col) if flipped else chr(ord('a') + col)
+                file_surf = coord_font.render(file_text, True, (0, 0, 0))
+                surface.blit(file_surf, (x + 2, y + square_size - file_surf.get_height() - 2))
+            if col == 7:
+                rank_text = str(row + 1) if flipped else str(8 - row)
+                rank_surf = coord_font.render(rank_text, True, (0, 0, 0))
+                surface.blit(rank_surf, (x + square_size - rank_surf.get_width() - 2, y + square_size - rank_surf.get_height() - 2))
+    return surface
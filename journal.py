@@ -0,0 +1,78 @@
+# journal.py
+import asyncio
+import json
+import os
+
+# Append-only JSON-lines log of game events. append() only buffers; a
+# background task group-commits the buffer every `interval` seconds on a
+# worker thread, so writing and fsync never block the event loop. close()
+# lets that task finish its current write and flush what is left.
+class Journal:
+    def __init__(self, path, fsync=True, interval=0.05):
+        self.path = path
+        self.fsync = fsync
+        self.interval = interval
+        self.buffer = []
+        self.pending = asyncio.Event()
+        self.closing = asyncio.Event()
+        self.file = open(path, "a", encoding="utf-8")
+        self.task = None
+
+    def append(self, record):
+        self.buffer.append(json.dumps(record, separators=(",", ":")) + "\n")
+        self.pending.set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not (self.closing.is_set() and not self.buffer):
+            await self.pending.wait()
+            if not self.closing.is_set():
+                try:
+                    await asyncio.wait_for(self.closing.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.pending.clear()
+            batch, self.buffer = self.buffer, []
+            if batch:
+                await loop.run_in_executor(None, self.write, "".join(batch))
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    async def close(self):
+        self.closing.set()
+        self.pending.set()
+        if self.task:
+            await self.task
+        elif self.buffer:
+            self.write("".join(self.buffer))
+            self.buffer = []
+        self.file.close()
+
+def read_journal(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write.
+                continue
+
+# Rewrites the journal so it only holds the given records, e.g. those of
+# games still live after replay, keeping restart time bounded.
+def compact_journal(path, records):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,199 @@
+# loadtest.py
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import websockets
+
+from bitboard import move_to_uci, uci_to_move
+from engine import ChessGame
+from metrics import Histogram
+from protocol import BINARY_SUBPROTOCOL, decode, encode
+
+# Simulated players use the real create/join/move protocol against a local
+# server. Both sides of a pair live in the same worker process, so the time
+# from one side sending a move to the other side receiving it is measured on
+# one clock. Run with a raised `ulimit -n` for thousands of pairs.
+
+class Stats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+
+async def connect(args):
+    return await websockets.connect(args.url, subprotocols=[BINARY_SUBPROTOCOL] if args.binary else None,
+                                    open_timeout=60, ping_interval=None)
+
+async def send(ws, args, message):
+    await ws.send(encode(message) if args.binary else json.dumps(message))
+
+async def receive(ws, args):
+    frame = await asyncio.wait_for(ws.recv(), 30)
+    return decode(frame, "action") if isinstance(frame, bytes) else json.loads(frame)
+
+async def play_side(ws, color, args, sent, stats):
+    game = ChessGame()
+    while len(game.history) < args.max_plies and game.status.result is None:
+        if game.current_player == color:
+            if args.think:
+                await asyncio.sleep(random.uniform(0, args.think) / 1000)
+            move = random.choice(game.legal_moves)
+            game.play_move(move)
+            sent[len(game.history)] = time.perf_counter()
+            await send(ws, args, {"type": "move", "move": move_to_uci(move)})
+            continue
+        message = await receive(ws, args)
+        if message["action"] == "move":
+            game.play_move(uci_to_move(message["move"]))
+            stats.latency.record(time.perf_counter() - sent.pop(len(game.history)))
+            stats.moves += 1
+        elif message["action"] == "error":
+            stats.errors += 1
+            return
+        elif message["action"] == "result":
+            break
+
+async def play_pair(args, deadline, stats):
+    while time.monotonic() < deadline:
+        white = black = None
+        try:
+            white = await connect(args)
+            create = {"type": "create"}
+            if args.time_control:
+                create["time_control"] = args.time_control
+            await send(white, args, create)
+            game_id = (await receive(white, args))["game_id"]
+            black = await connect(args)
+            await send(black, args, {"type": "join", "game_id": game_id})
+            await receive(white, args)
+            await receive(black, args)
+            sent = {}
+            await asyncio.gather(play_side(white, 'w', args, sent, stats), play_side(black, 'b', args, sent, stats))
+            stats.games += 1
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException, KeyError):
+            stats.errors += 1
+        finally:
+            for ws in (white, black):
+                if ws is not None:
+                    await ws.close()
+
+async def run_worker(pairs, args):
+    stats = Stats()
+    deadline = time.monotonic() + args.ramp + args.duration
+
+    async def start(delay):
+        await asyncio.sleep(delay)
+        await play_pair(args, deadline, stats)
+
+    await asyncio.gather(*(start(args.ramp * i / max(pairs, 1)) for i in range(pairs)))
+    return stats
+
+def worker(pairs, args):
+    return asyncio.run(run_worker(pairs, args))
+
+def find_server_pids():
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            continue
+        if any(os.path.basename(part) == b"server.py" for part in cmdline):
+            pids.append(int(name))
+    return pids
+
+# Total CPU seconds and resident MiB of the given processes, from /proc.
+def sample_processes(pids):
+    cpu = rss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return cpu, rss
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate pairs of players against a local server.py")
+    parser.add_argument("--url", default=f"ws://127.0.0.1:{os.environ.get('PORT', 8765)}")
+    parser.add_argument("--pairs", type=int, default=100, help="concurrent player pairs in total")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="client worker processes")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of play after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which pairs connect")
+    parser.add_argument("--max-plies", type=int, default=80, help="abandon a game after this many plies")
+    parser.add_argument("--think", type=float, default=0, help="max random think time per move in ms")
+    parser.add_argument("--time-control", help="time control label, untimed by default")
+    parser.add_argument("--binary", action="store_true", help="use the binary protocol")
+    parser.add_argument("--server-pid", type=int, action="append",
+                        help="server process to sample (repeatable); default: every process running server.py")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    processes = max(1, min(args.processes, args.pairs))
+    shares = [args.pairs // processes + (i < args.pairs % processes) for i in range(processes)]
+    pids = args.server_pid or find_server_pids()
+
+    cpu_start, _ = sample_processes(pids)
+    start = time.monotonic()
+    peak_rss = 0
+    with multiprocessing.Pool(processes) as pool:
+        pending = pool.starmap_async(worker, [(share, args) for share in shares])
+        while not pending.ready():
+            peak_rss = max(peak_rss, sample_processes(pids)[1])
+            pending.wait(1)
+        results = pending.get()
+    elapsed = time.monotonic() - start
+    cpu_end, rss = sample_processes(pids)
+
+    total = Stats()
+    for stats in results:
+        total.latency.merge(stats.latency)
+        total.moves += stats.moves
+        total.games += stats.games
+        total.errors += stats.errors
+    latency = total.latency.summary()
+    report = {
+        "pairs": args.pairs,
+        "processes": processes,
+        "binary": args.binary,
+        "seconds": round(elapsed, 3),
+        "games": total.games,
+        "moves": total.moves,
+        "moves_per_second": round(total.moves / elapsed, 1),
+        "errors": total.errors,
+        "latency_ms": {key[:-3]: value for key, value in latency.items() if key.endswith("_ms")},
+        "server_pids": pids,
+        "server_cpu_percent": round(100 * (cpu_end - cpu_start) / elapsed, 1) if pids else None,
+        "server_rss_mib": round(max(peak_rss, rss), 1) if pids else None,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['pairs']} pairs over {processes} processes for {report['seconds']}s"
+              f" ({'binary' if args.binary else 'json'} protocol)")
+        print(f"games {report['games']}  moves {report['moves']}  {report['moves_per_second']} moves/s  errors {report['errors']}")
+        lat = report["latency_ms"]
+        print(f"delivery latency ms: p50 {lat['p50']}  p90 {lat['p90']}  p99 {lat['p99']}  p999 {lat['p999']}  max {lat['max']}")
+        if pids:
+            print(f"server: {report['server_cpu_percent']}% CPU, {report['server_rss_mib']} MiB RSS (pids {pids})")
+        else:
+            print("server: no server.py process found to sample")
+    return 0 if total.errors == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
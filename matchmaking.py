@@ -0,0 +1,111 @@
+# matchmaking.py
+import bisect
+import itertools
+
+DEFAULT_RATING = 1500
+
+class Seek:
+    __slots__ = ('owner', 'rating', 'window', 'cancelled', 'pool', 'seq')
+
+    # window is the largest rating gap the seeker accepts, None for any.
+    def __init__(self, owner, rating=DEFAULT_RATING, window=None):
+        self.owner = owner
+        self.rating = rating
+        self.window = window
+        self.cancelled = False
+        self.pool = None
+        self.seq = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.pool is not None:
+            self.pool.remove(self)
+
+def compatible(a, b):
+    gap = abs(a.rating - b.rating)
+    return (a.window is None or gap <= a.window) and (b.window is None or gap <= b.window)
+
+# Open seeks for one time control, bucketed by exact rating with the ratings
+# kept sorted and each bucket in arrival order. No two waiting seeks are
+# compatible, so pair() only looks for partners for the seeks inserted since
+# it last ran, searching outward from their own rating; the server runs it in
+# batches on a timer rather than per seek. Cancelled seeks leave their bucket
+# straight away.
+class SeekPool:
+    def __init__(self):
+        self.buckets = {}
+        self.ratings = []
+        self.fresh = []
+        self.size = 0
+        self.counter = itertools.count()
+        self.dirty = False
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, seek):
+        seek.pool = self
+        seek.seq = next(self.counter)
+        bucket = self.buckets.get(seek.rating)
+        if bucket is None:
+            bucket = self.buckets[seek.rating] = {}
+            bisect.insort(self.ratings, seek.rating)
+        bucket[seek] = None
+        self.size += 1
+        self.fresh.append(seek)
+        self.dirty = True
+
+    def remove(self, seek):
+        bucket = self.buckets[seek.rating]
+        del bucket[seek]
+        if not bucket:
+            del self.buckets[seek.rating]
+            del self.ratings[bisect.bisect_left(self.ratings, seek.rating)]
+        seek.pool = None
+        self.size -= 1
+
+    # The waiting seek nearest in rating that both windows allow, the oldest
+    # among equally near ones, or None.
+    def partner(self, seek):
+        best = None
+        best_gap = None
+        below = bisect.bisect_left(self.ratings, seek.rating) - 1
+        above = below + 1
+        while below >= 0 or above < len(self.ratings):
+            if above == len(self.ratings) or (below >= 0 and seek.rating - self.ratings[below]
+                                              < self.ratings[above] - seek.rating):
+                rating = self.ratings[below]
+                below -= 1
+            else:
+                rating = self.ratings[above]
+                above += 1
+            # Ratings come nearest first, so none further on can do better.
+            gap = abs(seek.rating - rating)
+            if (seek.window is not None and gap > seek.window) or (best is not None and gap > best_gap):
+                break
+            for other in self.buckets[rating]:
+                if other is not seek and compatible(seek, other):
+                    if best is None or other.seq < best.seq:
+                        best, best_gap = other, gap
+                    break
+        return best
+
+    # Pairs each new seek, oldest first, with its partner if it has one and
+    # keeps the rest waiting. After limit pairs the remaining new seeks are
+    # left for the next call.
+    def pair(self, limit=None):
+        pairs = []
+        fresh, self.fresh = self.fresh, []
+        for index, seek in enumerate(fresh):
+            if len(pairs) == limit:
+                self.fresh = fresh[index:]
+                break
+            if seek.pool is not self:
+                continue
+            other = self.partner(seek)
+            if other is not None:
+                self.remove(seek)
+                self.remove(other)
+                pairs.append((other, seek))
+        self.dirty = bool(self.fresh)
+        return pairs
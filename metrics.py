@@ -0,0 +1,118 @@
+# metrics.py
+import asyncio
+import json
+import logging
+from collections import Counter
+
+# Recording is a dict increment or a few integer operations, so it can sit on
+# the relay's hot path; gauges are only evaluated when a snapshot is taken.
+counters = Counter()
+histograms = {}
+gauges = {}
+
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+
+# HDR-style histogram over whole microseconds: values below SUB_BUCKETS get
+# exact buckets, larger ones SUB_BUCKETS buckets per power of two, so each
+# bucket is within about 6% of the values it holds.
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (48 * SUB_BUCKETS)
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        if value < SUB_BUCKETS:
+            index = max(value, 0)
+        else:
+            shift = value.bit_length() - SUB_BITS - 1
+            index = min((shift << SUB_BITS) + (value >> shift), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @staticmethod
+    def upper_bound(index):
+        if index < SUB_BUCKETS:
+            return index
+        shift = (index >> SUB_BITS) - 1
+        return ((index - (shift << SUB_BITS)) + 1 << shift) - 1
+
+    # Microseconds at or below which the given fraction of values fall.
+    def percentile(self, fraction):
+        if not self.total:
+            return 0
+        threshold = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "p50_ms": self.percentile(0.5) / 1000,
+            "p90_ms": self.percentile(0.9) / 1000,
+            "p99_ms": self.percentile(0.99) / 1000,
+            "p999_ms": self.percentile(0.999) / 1000,
+            "max_ms": self.max / 1000,
+        }
+
+def count(name, amount=1):
+    counters[name] += amount
+
+def observe(name, seconds):
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram()
+    histogram.record(seconds)
+
+def gauge(name, read):
+    gauges[name] = read
+
+def snapshot():
+    return {
+        "gauges": {name: read() for name, read in gauges.items()},
+        "counters": dict(sorted(counters.items())),
+        "histograms": {name: histogram.summary() for name, histogram in histograms.items()},
+    }
+
+def summary_line():
+    data = snapshot()
+    parts = [f"{name}={value}" for name, value in data["gauges"].items()]
+    parts += [f"{name}={value}" for name, value in data["counters"].items()]
+    for name, summary in data["histograms"].items():
+        parts.append(f"{name}.p50={summary['p50_ms']}ms {name}.p99={summary['p99_ms']}ms {name}.max={summary['max_ms']}ms")
+    return " ".join(parts)
+
+async def log_periodically(interval):
+    while True:
+        await asyncio.sleep(interval)
+        logging.info("metrics %s", summary_line())
+
+# Minimal HTTP endpoint: any GET returns the snapshot as JSON.
+async def handle_http(reader, writer):
+    try:
+        while (await reader.readline()).strip():
+            pass
+        body = json.dumps(snapshot(), indent=2).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port):
+    return await asyncio.start_server(handle_http, host, port)
@@ -0,0 +1,108 @@
+# perft.py
+import argparse
+import json
+import platform
+import sys
+import time
+
+from engine import ChessGame
+
+# Reference node counts per depth for the standard perft positions and a few
+# en-passant, castling and promotion edge cases.
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("illegal-ep-pin", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     {1: 18, 2: 92, 3: 1670, 4: 10138}),
+    ("illegal-ep-bishop", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     {1: 13, 2: 102, 3: 1266, 4: 10276}),
+    ("ep-gives-check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     {1: 15, 2: 126, 3: 1928, 4: 13931}),
+    ("castle-gives-check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {1: 15, 2: 66, 3: 1198, 4: 6399}),
+    ("castle-rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ("promote-out-of-check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     {1: 11, 2: 133, 3: 1442, 4: 19174}),
+    ("promote-gives-check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     {1: 9, 2: 40, 3: 472, 4: 2661}),
+    ("underpromotion", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {1: 6, 2: 27, 3: 273, 4: 1329}),
+]
+
+def run(depth, names=None):
+    results = []
+    for name, fen, expected in POSITIONS:
+        if names and name not in names:
+            continue
+        game = ChessGame()
+        game.load_fen(fen)
+        for d in sorted(expected):
+            if d > depth:
+                break
+            start = time.perf_counter()
+            nodes = game.perft(d)
+            seconds = time.perf_counter() - start
+            results.append({
+                "position": name,
+                "depth": d,
+                "nodes": nodes,
+                "expected": expected[d],
+                "ok": nodes == expected[d],
+                "seconds": round(seconds, 6),
+                "nps": int(nodes / seconds) if seconds > 0 else None,
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness and speed check for ChessGame")
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth per position")
+    parser.add_argument("--position", action="append", help="only run the named position (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--fen", help="run divide on this FEN instead of the suite")
+    args = parser.parse_args()
+
+    if args.fen:
+        game = ChessGame()
+        game.load_fen(args.fen)
+        counts = game.divide(args.depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        print(f"\nTotal: {sum(counts.values())}")
+        return 0
+
+    results = run(args.depth, args.position)
+    total_nodes = sum(r["nodes"] for r in results)
+    total_seconds = sum(r["seconds"] for r in results)
+    ok = all(r["ok"] for r in results)
+    if args.json:
+        print(json.dumps({
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "depth": args.depth,
+            "results": results,
+            "total_nodes": total_nodes,
+            "total_seconds": round(total_seconds, 6),
+            "nps": int(total_nodes / total_seconds) if total_seconds > 0 else None,
+            "ok": ok,
+        }, indent=2))
+    else:
+        for r in results:
+            status = "ok" if r["ok"] else f"FAIL (expected {r['expected']})"
+            print(f"{r['position']:<22} depth {r['depth']}  {r['nodes']:>10}  {r['seconds']:8.3f}s  {r['nps'] or 0:>9} nps  {status}")
+        if total_seconds > 0:
+            print(f"\n{total_nodes} nodes in {total_seconds:.3f}s, {int(total_nodes / total_seconds)} nps")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
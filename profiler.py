@@ -0,0 +1,177 @@
+# profiler.py
+import csv
+import json
+import os
+import time
+from collections import deque
+
+import pygame
+
+# Per-frame timings of the GUI loop's phases, plus call counts and time spent
+# in selected methods of a class. The loop calls frame() at the top of each
+# iteration and mark(phase) after each phase; both return immediately while
+# profiling is off, and the method wrappers are only installed while it is on.
+# Method calls are recorded per frame alongside the phases. Method times are
+# inclusive, so a method called from another is counted in both.
+class FrameProfiler:
+    def __init__(self, target, methods, window=300, history=100000, refresh=0.5):
+        self.target = target
+        self.methods = methods
+        self.window = window
+        self.refresh = refresh
+        self.enabled = False
+        self.phases = []
+        self.recent = {}
+        self.frames = deque(maxlen=history)
+        self.recent_calls = deque(maxlen=window)
+        self.calls = {}
+        self.frame_count = 0
+        self.originals = {}
+        self.current = None
+        self.frame_calls = None
+        self.last = 0
+        self.version = 0
+        self.refreshed = 0
+        self.surface = None
+        self.surface_version = -1
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.phases = []
+        self.recent = {}
+        self.frames.clear()
+        self.recent_calls.clear()
+        self.calls = {name: [0, 0.0] for name in self.methods}
+        self.frame_count = 0
+        for name in self.methods:
+            self.originals[name] = getattr(self.target, name)
+            setattr(self.target, name, self.wrap(name, self.originals[name]))
+        self.current = {}
+        self.frame_calls = {name: [0, 0.0] for name in self.methods}
+        self.last = time.perf_counter()
+        self.version += 1
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for name, method in self.originals.items():
+            setattr(self.target, name, method)
+        self.originals = {}
+        self.current = None
+        self.version += 1
+
+    def wrap(self, name, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats = self.frame_calls[name]
+                stats[0] += 1
+                stats[1] += time.perf_counter() - start
+        return timed
+
+    # Closes the previous frame, if one was open, and starts the next.
+    def frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.current:
+            self.frames.append((self.current, self.frame_calls))
+            self.recent_calls.append(self.frame_calls)
+            self.frame_count += 1
+            for name, (calls, seconds) in self.frame_calls.items():
+                self.calls[name][0] += calls
+                self.calls[name][1] += seconds
+            for phase, seconds in self.current.items():
+                if phase not in self.recent:
+                    self.phases.append(phase)
+                    self.recent[phase] = deque(maxlen=self.window)
+                self.recent[phase].append(seconds)
+            if now - self.refreshed >= self.refresh:
+                self.refreshed = now
+                self.version += 1
+        self.current = {}
+        self.frame_calls = {name: [0, 0.0] for name in self.methods}
+        self.last = now
+
+    def mark(self, phase):
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0) + now - self.last
+        self.last = now
+
+    # Milliseconds at the 50th and 99th percentile over the last `window`
+    # frames that ran the phase.
+    def percentiles(self, phase):
+        values = sorted(self.recent[phase])
+        return (values[len(values) // 2] * 1000, values[min(len(values) - 1, int(len(values) * 0.99))] * 1000)
+
+    def lines(self):
+        lines = [f"{'phase':<10}{'p50 ms':>9}{'p99 ms':>9}"]
+        for phase in self.phases:
+            p50, p99 = self.percentiles(phase)
+            lines.append(f"{phase:<10}{p50:>9.2f}{p99:>9.2f}")
+        # Method figures are averages over the same window as the phases.
+        frames = max(len(self.recent_calls), 1)
+        lines.append(f"{'method':<22}{'calls/frame':>12}{'ms/frame':>10}")
+        for name in self.methods:
+            calls = sum(frame[name][0] for frame in self.recent_calls)
+            seconds = sum(frame[name][1] for frame in self.recent_calls)
+            lines.append(f"{name:<22}{calls / frames:>12.1f}{seconds * 1000 / frames:>10.3f}")
+        return lines
+
+    # The overlay panel, re-rendered at most every `refresh` seconds.
+    def overlay(self, font):
+        if self.surface_version != self.version:
+            rendered = [font.render(line, True, (255, 255, 255)) for line in self.lines()]
+            height = sum(surf.get_height() for surf in rendered)
+            self.surface = pygame.Surface((max(surf.get_width() for surf in rendered) + 12, height + 12), pygame.SRCALPHA)
+            self.surface.fill((0, 0, 0, 180))
+            y = 6
+            for surf in rendered:
+                self.surface.blit(surf, (6, y))
+                y += surf.get_height()
+            self.surface_version = self.version
+        return self.surface
+
+    # Writes every recorded frame as CSV and the summary as JSON, returning
+    # both paths. Dumps made within the same second get a numeric suffix.
+    def dump(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        stamp = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S"))
+        base = stamp
+        suffix = 1
+        while os.path.exists(base + ".csv") or os.path.exists(base + ".json"):
+            base = f"{stamp}-{suffix}"
+            suffix += 1
+        first = self.frame_count - len(self.frames)
+        with open(base + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame"] + [f"{phase}_ms" for phase in self.phases] + ["total_ms"]
+                            + [f"{name}_{column}" for name in self.methods for column in ("calls", "ms")])
+            for index, (phases, calls) in enumerate(self.frames, first):
+                writer.writerow([index] + [round(phases.get(phase, 0) * 1000, 3) for phase in self.phases]
+                                + [round(sum(phases.values()) * 1000, 3)]
+                                + [value for name in self.methods
+                                   for value in (calls[name][0], round(calls[name][1] * 1000, 3))])
+        summary = {
+            "frames": self.frame_count,
+            "phases": {phase: dict(zip(("p50_ms", "p99_ms"), (round(v, 3) for v in self.percentiles(phase))))
+                       for phase in self.phases},
+            "methods": {name: {"calls": calls, "total_ms": round(seconds * 1000, 3)}
+                        for name, (calls, seconds) in self.calls.items()},
+        }
+        with open(base + ".json", "w") as f:
+            json.dump(summary, f, indent=2)
+        return base + ".csv", base + ".json"
@@ -0,0 +1,103 @@
+# protocol.py
+import json
+import struct
+
+from bitboard import parse_square, square_name
+
+# Clients that offer this websocket subprotocol get binary frames from the
+# server; everyone else keeps the JSON protocol. Either kind of client may
+# send either kind of frame.
+BINARY_SUBPROTOCOL = "prichess.bin"
+
+# A frame whose first byte is below 64 is a move: from-square, to-square and,
+# for promotions, a third byte indexing PROMOTIONS. Squares are bitboard
+# indices (row * 8 + col, a8 = 0). Server move frames append both clocks as
+# two big-endian uint32 milliseconds for timed games; the ply is implied by
+# the number of moves the client has seen.
+#
+# Any other frame starts with an opcode byte >= 0x80, followed by the rest of
+# the message's fields as compact JSON when there are any.
+PROMOTIONS = (None, 'q', 'r', 'b', 'n')
+CLOCKS = struct.Struct(">II")
+
+OPCODES = {
+    "create": 0x80,
+    "join": 0x81,
+    "resume": 0x82,
+    "watch": 0x83,
+    "seek": 0x84,
+    "created": 0x90,
+    "start": 0x91,
+    "resumed": 0x92,
+    "result": 0x93,
+    "opponent": 0x94,
+    "error": 0x95,
+    "watching": 0x96,
+    "seeking": 0x97,
+}
+OPCODE_NAMES = {opcode: name for name, opcode in OPCODES.items()}
+
+def select_subprotocol(connection, subprotocols):
+    return BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in subprotocols else None
+
+def encode_move(text):
+    data = bytes((parse_square(text[:2]), parse_square(text[2:4])))
+    if len(text) > 4:
+        data += bytes((PROMOTIONS.index(text[4]),))
+    return data
+
+def decode_move(data):
+    if len(data) not in (2, 3) or data[0] >= 64 or data[1] >= 64 or (len(data) == 3 and not 0 < data[2] < len(PROMOTIONS)):
+        raise ValueError("Malformed move frame")
+    return square_name(data[0]) + square_name(data[1]) + (PROMOTIONS[data[2]] if len(data) == 3 else '')
+
+# Client messages are keyed by "type" and server messages by "action".
+def encode(message):
+    key = "type" if "type" in message else "action"
+    if message[key] == "move":
+        data = encode_move(message["move"])
+        if "clocks" in message:
+            data += CLOCKS.pack(*message["clocks"])
+        return data
+    fields = {k: v for k, v in message.items() if k != key}
+    data = bytes((OPCODES[message[key]],))
+    if fields:
+        data += json.dumps(fields, separators=(",", ":")).encode()
+    return data
+
+def decode(data, key="type"):
+    if not data:
+        raise ValueError("Empty frame")
+    if data[0] < 64:
+        if len(data) > 3:
+            return {key: "move", "move": decode_move(data[:-CLOCKS.size]),
+                    "clocks": list(CLOCKS.unpack(data[-CLOCKS.size:]))}
+        return {key: "move", "move": decode_move(data)}
+    if data[0] not in OPCODE_NAMES:
+        raise ValueError("Unknown opcode")
+    message = json.loads(data[1:]) if len(data) > 1 else {}
+    if not isinstance(message, dict):
+        raise ValueError("Message is not an object")
+    message[key] = OPCODE_NAMES[data[0]]
+    return message
+
+def parse(frame):
+    message = decode(frame) if isinstance(frame, bytes) else json.loads(frame)
+    if not isinstance(message, dict):
+        raise ValueError("Message is not an object")
+    return message
+
+# A message plus its encodings, each made on first use, so a message fanned
+# out to many connections is serialised at most once per format.
+class Frame:
+    __slots__ = ('message', 'payloads')
+
+    def __init__(self, message):
+        self.message = message
+        self.payloads = [None, None]
+
+    def payload(self, binary):
+        payload = self.payloads[binary]
+        if payload is None:
+            payload = self.payloads[binary] = encode(self.message) if binary else json.dumps(self.message)
+        return payload
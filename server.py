@@ -2,53 +2,786 @@
 import asyncio
 import websockets
 import json
+import logging
+import multiprocessing
+import multiprocessing.connection
 import os
+import random
+import signal
+import sys
+import time
 import uuid
+import zlib
+
+import metrics
+from bitboard import move_to_uci, uci_to_move
+from engine import ChessGame, TIME_CONTROLS
+from journal import Journal, read_journal, compact_journal
+from matchmaking import DEFAULT_RATING, Seek, SeekPool
+from protocol import BINARY_SUBPROTOCOL, Frame, encode, parse, select_subprotocol
+from timerwheel import TimerWheel
 
 games = {}
 
+PORT = int(os.environ.get("PORT", 8765))
+# With WORKERS > 1 every worker process accepts on PORT via SO_REUSEPORT and
+# owns the games whose id hashes to its shard. Connections for a game owned by
+# another shard are proxied to that worker's loopback port INTERNAL_PORT + shard.
+WORKERS = int(os.environ.get("WORKERS", 1))
+INTERNAL_PORT = int(os.environ.get("INTERNAL_PORT", PORT + 1))
+shard_index = 0
+
+# Each shard journals accepted moves and game lifecycle events to
+# JOURNAL_DIR/shard-N.log and replays it on startup; keep WORKERS unchanged
+# across restarts so game ids still hash to the shard holding their journal.
+# An empty JOURNAL_DIR disables journaling.
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "journal")
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "1") != "0"
+JOURNAL_INTERVAL = float(os.environ.get("JOURNAL_INTERVAL_MS", 50)) / 1000
+journal = None
+
+# Seconds a started game survives with both players disconnected, waiting
+# for one of them to resume with their session token.
+RESUME_GRACE = float(os.environ.get("RESUME_GRACE", 120))
+
+# Games nobody joins expire after UNJOINED_TTL seconds and games without a
+# move for IDLE_TTL seconds are evicted; each game holds a single lazily
+# re-armed timer on the timer wheel for whichever deadline comes first.
+# New games are refused once MAX_GAMES exist or the process exceeds
+# MAX_RSS_MIB (0 disables), and a game is drawn after MAX_PLIES plies.
+UNJOINED_TTL = float(os.environ.get("UNJOINED_TTL", 600))
+IDLE_TTL = float(os.environ.get("IDLE_TTL", 3600))
+MAX_GAMES = int(os.environ.get("MAX_GAMES", 100000))
+MAX_RSS_MIB = int(os.environ.get("MAX_RSS_MIB", 0))
+MAX_PLIES = int(os.environ.get("MAX_PLIES", 1000))
+MAX_MESSAGE_SIZE = int(os.environ.get("MAX_MESSAGE_SIZE", 4096))
+
+# Timed games use the menu's time controls by label, e.g. "3+2". The mover is
+# credited half the connection's measured round trip, capped at
+# MAX_LAG_COMPENSATION_MS, and flag timeouts allow the same grace so a move
+# already in flight is not beaten by the timer.
+TIMED_CONTROLS = {label: (base, increment) for base, increment, category, label in TIME_CONTROLS if base != "Custom"}
+MAX_LAG_COMPENSATION_MS = int(os.environ.get("MAX_LAG_COMPENSATION_MS", 500))
+timers = None
+
+# Seeks wait in one pool per time control and are paired every SEEK_TICK_MS.
+# With WORKERS > 1 each pool lives on the shard its name hashes to.
+SEEK_TICK = float(os.environ.get("SEEK_TICK_MS", 100)) / 1000
+pools = {time_control: SeekPool() for time_control in TIMED_CONTROLS}
+
+# Each shard serves its metrics as JSON on 127.0.0.1:METRICS_PORT + shard and
+# logs a summary line every METRICS_INTERVAL seconds; 0 disables either.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", PORT + 1000))
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", 60))
+sessions = set()
+
+SEND_QUEUE_SIZE = int(os.environ.get("SEND_QUEUE_SIZE", 64))
+# What to do when a client's outbound queue is full: "disconnect" closes the
+# slow connection, "drop" discards the new message for that client only.
+SLOW_CONSUMER_POLICY = os.environ.get("SLOW_CONSUMER_POLICY", "disconnect")
+
+# Fire-and-forget tasks; the event loop only keeps weak references, so they
+# are held here until they finish.
+background_tasks = set()
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+class Session:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer = asyncio.create_task(self.write_loop())
+        self.closing = False
+        self.game_id = None
+        self.seat = None
+        self.seek = None
+        self.binary = websocket.subprotocol == BINARY_SUBPROTOCOL
+        self.latency = relayed_latency(websocket)
+        sessions.add(self)
+
+    def encode(self, message):
+        return encode(message) if self.binary else json.dumps(message)
+
+    def send(self, message):
+        self.send_payload(self.encode(message))
+
+    # Never blocks: a full queue triggers the slow-consumer policy instead.
+    # received is the perf_counter time of the message that caused this one,
+    # used to measure relay latency up to delivery.
+    def send_payload(self, payload, received=None):
+        if self.closing:
+            return
+        try:
+            self.queue.put_nowait((payload, received))
+        except asyncio.QueueFull:
+            metrics.count(f"slow_consumer.{SLOW_CONSUMER_POLICY}")
+            if SLOW_CONSUMER_POLICY == "disconnect":
+                self.closing = True
+                spawn(self.websocket.close(1013, "Client too slow"))
+
+    async def write_loop(self):
+        while True:
+            payload, received = await self.queue.get()
+            try:
+                await self.websocket.send(payload)
+            except websockets.ConnectionClosed:
+                return
+            metrics.count("messages_out")
+            if received is not None:
+                metrics.observe("relay_latency", time.perf_counter() - received)
+
+    def close(self):
+        self.closing = True
+        self.writer.cancel()
+        sessions.discard(self)
+
+# Everything spectators see of a game, in order: one frame per ply, then the
+# result. All watchers share the frames and walk them with their own cursor,
+# so a slow watcher only falls behind and never holds up anyone else.
+class Feed:
+    def __init__(self):
+        self.frames = []
+        self.changed = asyncio.Event()
+        self.closed = False
+        self.watchers = 0
+
+    def append(self, frame):
+        self.frames.append(frame)
+        self.wake()
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+def shard_for(game_id):
+    return zlib.crc32(game_id.encode()) % WORKERS
+
+def new_game_id():
+    while True:
+        game_id = str(uuid.uuid4())[:8]
+        if shard_for(game_id) == shard_index and game_id not in games:
+            return game_id
+
+# The client's round trip is measured here, on the client-facing socket, and
+# handed to the owning shard in an X-Client-Latency header; a "latency"
+# message updates it before the next forwarded message whenever a keepalive
+# ping has changed it. On the loopback hop websocket.latency is near zero.
+async def proxy(websocket, first_message, shard):
+    subprotocols = [websocket.subprotocol] if websocket.subprotocol else None
+    latency = websocket.latency
+    if not latency:
+        try:
+            latency = await asyncio.wait_for(await websocket.ping(), 1)
+        except asyncio.TimeoutError:
+            pass
+    async with websockets.connect(f"ws://127.0.0.1:{INTERNAL_PORT + shard}", subprotocols=subprotocols,
+                                  additional_headers={"X-Client-Latency": str(latency)}) as upstream:
+        await upstream.send(first_message)
+
+        async def report(source, target):
+            nonlocal latency
+            if source is websocket and websocket.latency and websocket.latency != latency:
+                latency = websocket.latency
+                await target.send(json.dumps({"type": "latency", "seconds": latency}))
+
+        # Whichever side closes first has its close code and reason passed on,
+        # so a client sees "Resumed elsewhere" or "Client too slow" from the
+        # owning shard. 1005 and 1006 only describe the hop and are not sent.
+        async def pump(source, target):
+            try:
+                async for message in source:
+                    await report(source, target)
+                    await target.send(message)
+            except websockets.ConnectionClosed:
+                pass
+            if source.close_code is not None:
+                if source.close_code in (1005, 1006):
+                    await target.close()
+                else:
+                    await target.close(source.close_code, source.close_reason)
+
+        pumps = [asyncio.create_task(pump(websocket, upstream)), asyncio.create_task(pump(upstream, websocket))]
+        done, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+
+def broadcast(recipients, message, received=None):
+    frame = message if isinstance(message, Frame) else Frame(message)
+    for session in recipients:
+        session.send_payload(frame.payload(session.binary), received)
+
+def seat_color(seat):
+    return 'w' if seat == 0 else 'b'
+
+def game_result(game):
+    status = game.status
+    if status.result is None:
+        return None
+    if status.result == 'checkmate':
+        winner = 'b' if game.current_player == 'w' else 'w'
+        return {"action": "result", "result": "1-0" if winner == 'w' else "0-1", "reason": "checkmate"}
+    return {"action": "result", "result": "1/2-1/2", "reason": status.result}
+
+def record(event, game_id, **fields):
+    if journal is not None:
+        journal.append({"event": event, "game_id": game_id, **fields})
+
+def new_game_entry(time_control=None):
+    game = ChessGame(*TIMED_CONTROLS[time_control]) if time_control else ChessGame()
+    now = time.monotonic()
+    return {"players": [None, None], "tokens": [None, None], "moves": [], "game": game,
+            "result": None, "time_control": time_control, "flag_timer": None, "feed": Feed(),
+            "expiry": None, "created": now, "active": now, "vacated": None}
+
+rss_sample = [0.0, 0]
+
+def rss_mib():
+    now = time.monotonic()
+    if now - rss_sample[0] >= 1:
+        with open("/proc/self/statm") as f:
+            rss_sample[:] = [now, int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") >> 20]
+    return rss_sample[1]
+
+# Returns why no new game can be created, or None.
+def capacity_error():
+    if len(games) >= MAX_GAMES:
+        return "Server full"
+    if MAX_RSS_MIB and rss_mib() >= MAX_RSS_MIB:
+        return "Server full"
+    return None
+
+def new_token():
+    return uuid.uuid4().hex
+
+# Moves are stored, journaled and relayed in canonical UCI (lower-case
+# promotion), whatever case the client sent.
+def commit_move(entry, move):
+    text = move_to_uci(move)
+    entry["game"].play_move(move)
+    entry["moves"].append(text)
+    entry["active"] = time.monotonic()
+    entry["result"] = game_result(entry["game"])
+    if entry["result"] is None and len(entry["moves"]) >= MAX_PLIES:
+        entry["result"] = {"action": "result", "result": "1/2-1/2", "reason": "move-limit"}
+    frame = Frame({"action": "move", "move": text, "ply": len(entry["moves"]), **clock_fields(entry)})
+    entry["feed"].append(frame)
+    if entry["result"]:
+        entry["feed"].append(Frame(entry["result"]))
+    return frame
+
+def lag_ms(session):
+    latency = session.websocket.latency if session.latency is None else session.latency
+    return min(int((latency or 0) * 500), MAX_LAG_COMPENSATION_MS)
+
+# The client's round trip in seconds for a connection relayed by another
+# shard's proxy, None for a direct one.
+def relayed_latency(websocket):
+    if WORKERS == 1 or websocket.local_address[1] != INTERNAL_PORT + shard_index:
+        return None
+    return valid_latency(websocket.request.headers.get("X-Client-Latency"))
+
+def valid_latency(value):
+    try:
+        latency = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Bad latency")
+    if not 0 <= latency < 3600:
+        raise ValueError("Bad latency")
+    return latency
+
+# Seconds the player to move has left, counting the time since the last move.
+def time_left(game):
+    left = game.white_time if game.current_player == 'w' else game.black_time
+    if game.last_tick is not None:
+        left -= (game.clock() - game.last_tick) / 1000.0
+    return left
+
+def clock_fields(entry):
+    if entry["time_control"] is None:
+        return {}
+    game = entry["game"]
+    times = [game.white_time, game.black_time]
+    if not entry["result"]:
+        times[0 if game.current_player == 'w' else 1] = time_left(game)
+    return {"clocks": [max(0, int(t * 1000)) for t in times]}
+
+def timeout_result(winner):
+    return {"action": "result", "result": "1-0" if winner == 'w' else "0-1", "reason": "timeout"}
+
+def flag(game_id, winner):
+    entry = games[game_id]
+    entry["result"] = timeout_result(winner)
+    schedule_flag(game_id, entry)
+    record("flag", game_id, winner=winner)
+    frame = Frame(entry["result"])
+    entry["feed"].append(frame)
+    broadcast(seated(entry), frame)
+
+def check_flag(game_id):
+    entry = games.get(game_id)
+    if entry is None or entry["result"]:
+        return
+    entry["flag_timer"] = None
+    game = entry["game"]
+    if time_left(game) + MAX_LAG_COMPENSATION_MS / 1000 > 0:
+        schedule_flag(game_id, entry)
+        return
+    game.update_clock()
+    flag(game_id, game.winner)
+
+# Re-arms the single flag timer of a game for the player now to move; the
+# clocks only run once both sides have made their first move.
+def schedule_flag(game_id, entry):
+    if entry["flag_timer"] is not None:
+        entry["flag_timer"].cancel()
+        entry["flag_timer"] = None
+    game = entry["game"]
+    if entry["time_control"] is None or entry["result"] or game.last_tick is None:
+        return
+    delay = time_left(game) + MAX_LAG_COMPENSATION_MS / 1000
+    entry["flag_timer"] = timers.schedule(delay, check_flag, game_id)
+
+def restore_games(path):
+    live = {}
+    for rec in read_journal(path):
+        game_id = rec.get("game_id")
+        if rec.get("event") == "create":
+            live[game_id] = [rec]
+        elif game_id in live:
+            if rec.get("event") == "end":
+                del live[game_id]
+            else:
+                live[game_id].append(rec)
+    for game_id, records in live.items():
+        entry = new_game_entry(records[0].get("time_control"))
+        game = entry["game"]
+        for rec in records:
+            if rec["event"] == "create":
+                entry["tokens"][0] = rec.get("token")
+            elif rec["event"] == "join":
+                entry["tokens"][1] = rec.get("token")
+            elif rec["event"] == "move":
+                frame = commit_move(entry, uci_to_move(rec["move"]))
+                if "clocks" in rec:
+                    game.white_time, game.black_time = (t / 1000 for t in rec["clocks"])
+                    frame.message["clocks"] = rec["clocks"]
+            elif rec["event"] == "flag":
+                entry["result"] = timeout_result(rec["winner"])
+                entry["feed"].append(Frame(entry["result"]))
+        # Clocks resume from their journaled values; downtime is not charged.
+        games[game_id] = entry
+        entry["vacated"] = entry["created"]
+        schedule_expiry(game_id, entry)
+        schedule_flag(game_id, entry)
+    compact_journal(path, [rec for records in live.values() for rec in records])
+    return len(live)
+
+# Counter names come from a fixed set so clients cannot mint new ones.
+MESSAGE_TYPES = {"create", "join", "resume", "watch", "seek", "move"}
+
+# Fields used as dict keys must be strings (or absent) before any lookup.
+def check_fields(data):
+    for field in ("game_id", "time_control", "token"):
+        if not (data.get(field) is None or isinstance(data[field], str)):
+            raise ValueError(f"{field} must be a string")
+
+def count_message(data):
+    kind = data.get("type")
+    metrics.count(f"messages_in.{kind}" if isinstance(kind, str) and kind in MESSAGE_TYPES else "messages_in.other")
+
+def seated(entry):
+    return [player for player in entry["players"] if player is not None]
+
+# Returns an error message, or None once the move has been played and recorded.
+# Timed games charge the mover's clock on receipt, less lag milliseconds.
+def apply_move(game_id, seat, text, lag=0):
+    entry = games[game_id]
+    game = entry["game"]
+    if None in entry["tokens"]:
+        return "Game has not started"
+    if entry["result"]:
+        return "Game is over"
+    if seat_color(seat) != game.current_player:
+        return "Not your turn"
+    if not isinstance(text, str) or len(text) not in (4, 5):
+        return "Illegal move"
+    try:
+        move = uci_to_move(text)
+    except ValueError:
+        return "Illegal move"
+    if move not in game.legal_moves:
+        return "Illegal move"
+    if entry["time_control"]:
+        game.update_clock(lag)
+        if game.game_over:
+            flag(game_id, game.winner)
+            return "Game is over"
+    commit_move(entry, move)
+    schedule_flag(game_id, entry)
+    return None
+
+def end_game(game_id):
+    entry = games.pop(game_id)
+    for timer in (entry["flag_timer"], entry["expiry"]):
+        if timer is not None:
+            timer.cancel()
+    entry["feed"].close()
+    record("end", game_id)
+
+# The earliest of the game's deadlines as (monotonic time, reason).
+def expiry_deadline(entry):
+    deadlines = [(entry["active"] + IDLE_TTL, "Game idle")]
+    if entry["tokens"][1] is None:
+        deadlines.append((entry["created"] + UNJOINED_TTL, "Nobody joined"))
+    if entry["vacated"] is not None:
+        deadlines.append((entry["vacated"] + RESUME_GRACE, "Game abandoned"))
+    return min(deadlines)
+
+def schedule_expiry(game_id, entry):
+    if entry["expiry"] is not None:
+        entry["expiry"].cancel()
+    deadline, reason = expiry_deadline(entry)
+    entry["expiry"] = timers.schedule(deadline - time.monotonic(), check_expiry, game_id)
+
+# Activity only moves deadlines later, so it never touches the timer; a timer
+# that fires early just re-arms itself for the current deadline.
+def check_expiry(game_id):
+    entry = games.get(game_id)
+    if entry is None:
+        return
+    entry["expiry"] = None
+    deadline, reason = expiry_deadline(entry)
+    if time.monotonic() < deadline:
+        schedule_expiry(game_id, entry)
+        return
+    metrics.count("games_expired")
+    for session in seated(entry):
+        session.game_id = session.seat = None
+        spawn(dismiss(session, reason))
+    end_game(game_id)
+
+async def dismiss(session, reason):
+    session.close()
+    try:
+        await session.websocket.send(session.encode({"action": "error", "msg": reason}))
+        await session.websocket.close()
+    except websockets.ConnectionClosed:
+        pass
+
+def leave_game(session):
+    entry = games.get(session.game_id)
+    if entry is None or entry["players"][session.seat] is not session:
+        return
+    entry["players"][session.seat] = None
+    if entry["tokens"][1] is None:
+        # Nobody joined yet, so there is nothing worth resuming.
+        end_game(session.game_id)
+    elif seated(entry):
+        broadcast(seated(entry), {"action": "opponent", "connected": False})
+    else:
+        entry["vacated"] = time.monotonic()
+        schedule_expiry(session.game_id, entry)
+    session.game_id = session.seat = None
+
+# Rebinds the token's seat to the new session, replacing any stale connection
+# still holding it, and returns the seat or None for an unknown token.
+def resume_seat(entry, token, session):
+    if not isinstance(token, str) or token not in entry["tokens"]:
+        return None
+    seat = entry["tokens"].index(token)
+    entry["vacated"] = None
+    stale = entry["players"][seat]
+    if stale is not None:
+        stale.game_id = stale.seat = None
+        stale.close()
+        spawn(stale.websocket.close(4000, "Resumed elsewhere"))
+    entry["players"][seat] = session
+    return seat
+
+def start_paired_game(time_control, white, black):
+    game_id = new_game_id()
+    games[game_id] = entry = new_game_entry(time_control)
+    for seat, session in enumerate((white, black)):
+        session.seek = None
+        session.game_id, session.seat = game_id, seat
+        entry["players"][seat] = session
+        entry["tokens"][seat] = new_token()
+    schedule_expiry(game_id, entry)
+    record("create", game_id, token=entry["tokens"][0], time_control=time_control)
+    record("join", game_id, token=entry["tokens"][1])
+    start = {"action": "start", "game_id": game_id, "time_control": time_control, **clock_fields(entry)}
+    for session in (white, black):
+        session.send({**start, "color": seat_color(session.seat), "token": entry["tokens"][session.seat]})
+
+async def pairing_loop():
+    while True:
+        await asyncio.sleep(SEEK_TICK)
+        for time_control, pool in pools.items():
+            if not pool.dirty:
+                continue
+            # Each pair starts a game, so while the server is full the seeks
+            # stay queued for a later tick.
+            if capacity_error():
+                break
+            for first, second in pool.pair(MAX_GAMES - len(games)):
+                if random.random() < 0.5:
+                    first, second = second, first
+                start_paired_game(time_control, first.owner, second.owner)
+
+# Streams the game's feed from the given ply until the game goes away or the
+# spectator disconnects, whichever comes first.
+async def watch(websocket, entry, ply):
+    binary = websocket.subprotocol == BINARY_SUBPROTOCOL
+    feed = entry["feed"]
+    await websocket.send(Frame({"action": "watching", "time_control": entry["time_control"], "ply": ply}).payload(binary))
+    cursor = ply
+    feed.watchers += 1
+    closed = asyncio.ensure_future(websocket.wait_closed())
+    try:
+        while True:
+            while cursor < len(feed.frames):
+                await websocket.send(feed.frames[cursor].payload(binary))
+                cursor += 1
+            if feed.closed:
+                return
+            changed = asyncio.ensure_future(feed.changed.wait())
+            await asyncio.wait((changed, closed), return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                changed.cancel()
+                return
+    finally:
+        closed.cancel()
+        feed.watchers -= 1
+
 async def handler(websocket):
+    session = None
     try:
         message = await websocket.recv()
-        data = json.loads(message)
+        data = parse(message)
+        count_message(data)
+        check_fields(data)
+        owner = f"seek:{data.get('time_control')}" if data.get("type") == "seek" else data.get("game_id")
+        if WORKERS > 1 and isinstance(owner, str) and shard_for(owner) != shard_index:
+            await proxy(websocket, message, shard_for(owner))
+            return
+
+        if data["type"] == "watch":
+            # Spectators catch up from the requested ply (default: the start).
+            entry = games.get(data.get("game_id"))
+            ply = data.get("ply", 0)
+            if entry is None or not isinstance(ply, int) or not 0 <= ply <= len(entry["moves"]):
+                await websocket.send(Frame({"action": "error", "msg": "Game not found"}).payload(
+                    websocket.subprotocol == BINARY_SUBPROTOCOL))
+                return
+            await watch(websocket, entry, ply)
+            return
+
+        session = Session(websocket)
 
         if data["type"] == "create":
-            game_id = str(uuid.uuid4())[:8]
-            games[game_id] = {"players": [websocket], "moves": []}
-            await websocket.send(json.dumps({"action": "created", "game_id": game_id}))
+            time_control = data.get("time_control")
+            error = "Unknown time control" if time_control is not None and time_control not in TIMED_CONTROLS else capacity_error()
+            if error:
+                metrics.count("rejected.create")
+                await websocket.send(session.encode({"action": "error", "msg": error}))
+                return
+            game_id = new_game_id()
+            games[game_id] = entry = new_game_entry(time_control)
+            entry["players"][0] = session
+            entry["tokens"][0] = token = new_token()
+            session.game_id, session.seat = game_id, 0
+            schedule_expiry(game_id, entry)
+            record("create", game_id, token=token, time_control=time_control)
+            session.send({"action": "created", "game_id": game_id, "token": token, "time_control": time_control})
 
         elif data["type"] == "join":
             game_id = data["game_id"]
-            if game_id not in games or len(games[game_id]["players"]) >= 2:
-                await websocket.send(json.dumps({"action": "error", "msg": "Game full or not found"}))
+            entry = games.get(game_id)
+            # Seats are fixed once play starts, so an emptied seat is not up for grabs.
+            if entry is None or entry["tokens"][1] is not None:
+                await websocket.send(session.encode({"action": "error", "msg": "Game full or not found"}))
+                return
+            entry["players"][1] = session
+            entry["tokens"][1] = token = new_token()
+            session.game_id, session.seat = game_id, 1
+            record("join", game_id, token=token)
+            start = {"action": "start", "time_control": entry["time_control"], **clock_fields(entry)}
+            # White may be away, e.g. after a restart; they pick the game up via resume.
+            if entry["players"][0] is not None:
+                entry["players"][0].send({**start, "color": "w"})
+            session.send({**start, "color": "b", "token": token})
+
+        elif data["type"] == "seek":
+            time_control = data.get("time_control")
+            rating = data.get("rating", DEFAULT_RATING)
+            window = data.get("rating_range")
+            if time_control not in pools or not isinstance(rating, int) or not (window is None or isinstance(window, int)):
+                await websocket.send(session.encode({"action": "error", "msg": "Invalid seek"}))
+                return
+            error = capacity_error()
+            if error:
+                metrics.count("rejected.seek")
+                await websocket.send(session.encode({"action": "error", "msg": error}))
+                return
+            session.seek = Seek(session, rating, window)
+            pools[time_control].insert(session.seek)
+            session.send({"action": "seeking", "time_control": time_control})
+
+        elif data["type"] == "resume":
+            # The client reports how many plies it already has and only the
+            # moves after that are sent back.
+            game_id = data.get("game_id")
+            entry = games.get(game_id)
+            ply = data.get("ply", 0)
+            if entry is None or not isinstance(ply, int) or not 0 <= ply <= len(entry["moves"]):
+                await websocket.send(session.encode({"action": "error", "msg": "Cannot resume game"}))
                 return
-            games[game_id]["players"].append(websocket)
-            for player in games[game_id]["players"]:
-                await player.send(json.dumps({"action": "start"}))
+            seat = resume_seat(entry, data.get("token"), session)
+            if seat is None:
+                await websocket.send(session.encode({"action": "error", "msg": "Cannot resume game"}))
+                return
+            session.game_id, session.seat = game_id, seat
+            session.send({"action": "resumed", "color": seat_color(seat), "ply": ply,
+                          "moves": entry["moves"][ply:], **clock_fields(entry)})
+            if entry["result"]:
+                session.send(entry["result"])
+            broadcast([player for player in seated(entry) if player is not session],
+                      {"action": "opponent", "connected": True})
 
         async for message in websocket:
-            data = json.loads(message)
+            received = time.perf_counter()
+            data = parse(message)
+            if session.latency is not None and data.get("type") == "latency":
+                session.latency = valid_latency(data.get("seconds"))
+                continue
+            count_message(data)
+            check_fields(data)
             if data.get("type") == "move":
-                game_id = data.get("game_id")
-                if game_id in games:
-                    for player in games[game_id]["players"]:
-                        if player != websocket:
-                            await player.send(json.dumps({"action": "move", "move": data["move"]}))
+                entry = games.get(session.game_id)
+                if entry is None or data.get("game_id", session.game_id) != session.game_id:
+                    session.send({"action": "error", "msg": "Not in this game"})
+                    continue
+                error = apply_move(session.game_id, session.seat, data.get("move"), lag_ms(session))
+                if error:
+                    session.send({"action": "error", "msg": error})
+                    continue
+                record("move", session.game_id, move=entry["moves"][-1], **clock_fields(entry))
+                broadcast([player for player in seated(entry) if player is not session],
+                          entry["feed"].frames[len(entry["moves"]) - 1], received)
+                if entry["result"]:
+                    broadcast(seated(entry), entry["result"])
 
+    except websockets.ConnectionClosed:
+        pass
+    except (ValueError, KeyError) as e:
+        metrics.count("errors.protocol")
+        logging.warning("Dropping connection after malformed message: %r", e)
     except Exception:
+        metrics.count("errors.internal")
+        logging.exception("Connection handler failed")
+    finally:
+        if session is not None:
+            if session.seek is not None:
+                session.seek.cancel()
+            session.close()
+            leave_game(session)
+
+def register_gauges():
+    metrics.gauge("connections", lambda: len(sessions))
+    metrics.gauge("games", lambda: len(games))
+    metrics.gauge("spectators", lambda: sum(entry["feed"].watchers for entry in games.values()))
+    metrics.gauge("seeks", lambda: sum(len(pool) for pool in pools.values()))
+    metrics.gauge("send_queue_total", lambda: sum(session.queue.qsize() for session in sessions))
+    metrics.gauge("send_queue_max", lambda: max((session.queue.qsize() for session in sessions), default=0))
+
+async def main(shard=0):
+    global shard_index, journal, timers
+    shard_index = shard
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # websockets logs every connection at INFO, too chatty at our volume.
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+    timers = TimerWheel()
+    timers.start()
+    pairing = asyncio.create_task(pairing_loop())
+    if JOURNAL_DIR:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        path = os.path.join(JOURNAL_DIR, f"shard-{shard}.log")
+        restored = restore_games(path)
+        if restored:
+            logging.info("Restored %d games from %s", restored, path)
+        journal = Journal(path, fsync=JOURNAL_FSYNC, interval=JOURNAL_INTERVAL)
+        journal.start()
+    register_gauges()
+    if METRICS_PORT:
+        await metrics.serve("127.0.0.1", METRICS_PORT + shard)
+    if METRICS_INTERVAL:
+        metrics_log = asyncio.create_task(metrics.log_periodically(METRICS_INTERVAL))
+    logging.info("Starting WebSocket server on port %d (shard %d/%d)...", PORT, shard + 1, WORKERS)
+    servers = [await websockets.serve(handler, "0.0.0.0", PORT, reuse_port=WORKERS > 1,
+                                      select_subprotocol=select_subprotocol, max_size=MAX_MESSAGE_SIZE)]
+    if WORKERS > 1:
+        servers.append(await websockets.serve(handler, "127.0.0.1", INTERNAL_PORT + shard,
+                                              select_subprotocol=select_subprotocol, max_size=MAX_MESSAGE_SIZE))
+    # SIGTERM/SIGINT stop accepting and close every connection; once their
+    # handlers have run, whatever the journal still buffers is flushed.
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, lambda: [server.close() for server in servers])
+    try:
+        for server in servers:
+            await server.wait_closed()
+    finally:
+        if journal is not None:
+            await journal.close()
+        logging.info("Shard %d stopped", shard)
+
+def run_worker(shard):
+    asyncio.run(main(shard))
+
+def start_worker(shard):
+    worker = multiprocessing.Process(target=run_worker, args=(shard,), daemon=True)
+    worker.start()
+    return worker
+
+# Restarts any worker that dies (it replays its shard's journal, so its games
+# come back), waiting a second first if it died within a second of starting.
+# SIGTERM or SIGINT stops the workers before the supervisor exits, so none
+# are left holding PORT.
+def supervise():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    workers = {}
+    started = {}
+    try:
+        for shard in range(WORKERS):
+            workers[shard], started[shard] = start_worker(shard), time.monotonic()
+        while True:
+            multiprocessing.connection.wait([worker.sentinel for worker in workers.values()])
+            for shard, worker in workers.items():
+                if worker.exitcode is None:
+                    continue
+                logging.error("Worker for shard %d exited with code %s, restarting", shard, worker.exitcode)
+                if time.monotonic() - started[shard] < 1:
+                    time.sleep(1)
+                workers[shard], started[shard] = start_worker(shard), time.monotonic()
+    except KeyboardInterrupt:
         pass
     finally:
-        for gid in list(games.keys()):
-            if websocket in games[gid]["players"]:
-                games[gid]["players"].remove(websocket)
-                if not games[gid]["players"]:
-                    del games[gid]
-
-async def main():
-    port = int(os.environ.get("PORT", 8765))
-    print(f"Starting WebSocket server on port {port}...")
-    server = await websockets.serve(handler, "0.0.0.0", port)
-    await server.wait_closed()
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.join()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if WORKERS > 1:
+        supervise()
+    else:
+        asyncio.run(main())
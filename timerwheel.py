@@ -0,0 +1,65 @@
+# timerwheel.py
+import asyncio
+import logging
+import time
+
+class Timer:
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+# Hashed timer wheel: one task ticks every `resolution` seconds and fires the
+# timers due in the current slot, so scheduling and cancelling are O(1) and
+# the cost of idle timers does not grow with their number. Timers further out
+# than one revolution just wait in their slot until their tick comes round.
+class TimerWheel:
+    def __init__(self, resolution=0.05, slots=1024):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(slots)]
+        self.tick = 0
+        self.origin = None
+        self.task = None
+
+    def start(self):
+        self.origin = time.monotonic()
+        self.task = asyncio.create_task(self.run())
+
+    def schedule(self, delay, callback, *args):
+        ticks = max(1, int(-(-delay // self.resolution)))
+        timer = Timer(self.tick + ticks, callback, args)
+        self.slots[timer.tick % len(self.slots)].append(timer)
+        return timer
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.resolution)
+            # Catch up on every tick that elapsed, in case the loop was busy.
+            target = int((time.monotonic() - self.origin) / self.resolution)
+            while self.tick < target:
+                self.tick += 1
+                self.advance()
+
+    def advance(self):
+        slot = self.slots[self.tick % len(self.slots)]
+        if not slot:
+            return
+        due = [timer for timer in slot if timer.tick <= self.tick]
+        slot[:] = [timer for timer in slot if timer.tick > self.tick and not timer.cancelled]
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logging.exception("Timer callback failed")
+
+    def close(self):
+        if self.task:
+            self.task.cancel()